@@ -5,11 +5,76 @@ Provides SHA-256 checksums for agencies and corrections to:
 - Detect data changes between ingestion runs
 - Verify data integrity during ETL
 - Track data lineage
+
+Records are canonicalized with orjson (sorted keys, compact, UTF-8) when it is
+installed; the stdlib fallback emits byte-identical output, just more slowly.
+
+Hashing goes through hashlib's OpenSSL backend with one-shot calls. OpenSSL
+dispatches to the x86 SHA extensions (SHA-NI) at runtime when the CPU has
+them, which is the fast path for these small payloads; see
+sha_extensions_available().
 """
 
 import hashlib
 import json
-from typing import Any, Dict
+from typing import Any, Dict, List, Tuple
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - orjson is listed in requirements.txt
+    orjson = None
+
+# Fields covered by each record checksum, in canonical (sorted) order. Payloads
+# are built in this order so OPT_SORT_KEYS finds the top level already sorted;
+# the sort itself stays on because nested dicts (cfr_references, hierarchy)
+# keep whatever key order the upstream API sent.
+AGENCY_CHECKSUM_FIELDS = ('cfr_references', 'children', 'name', 'short_name', 'slug')
+CORRECTION_CHECKSUM_FIELDS = (
+    'cfr_references', 'corrective_action', 'error_corrected', 'error_occurred',
+    'fr_citation', 'id', 'title', 'year',
+)
+
+# One-shot constructor: hashing the whole payload in the constructor call
+# avoids a separate .update() round trip per record.
+_sha256_oneshot = hashlib.sha256
+
+
+def sha_extensions_available() -> bool:
+    """
+    Report whether the CPU advertises the SHA extensions OpenSSL uses.
+    
+    Returns:
+        True if /proc/cpuinfo lists sha_ni (x86) or sha2 (arm64), else False
+    """
+    # hashlib only routes through OpenSSL when built against it
+    if _sha256_oneshot.__name__ != 'openssl_sha256':
+        return False
+    try:
+        with open('/proc/cpuinfo', 'r') as f:
+            for line in f:
+                if line.startswith(('flags', 'Features')):
+                    flags = line.split(':', 1)[1].split()
+                    return 'sha_ni' in flags or 'sha2' in flags
+    except OSError:
+        pass
+    return False
+
+
+def canonical_json(data: Dict[str, Any]) -> bytes:
+    """
+    Serialize a record to canonical JSON bytes (sorted keys, no whitespace).
+    
+    Args:
+        data: Dictionary containing the record data
+        
+    Returns:
+        UTF-8 encoded JSON
+    """
+    if orjson is not None:
+        return orjson.dumps(data, option=orjson.OPT_SORT_KEYS)
+    return json.dumps(
+        data, sort_keys=True, separators=(',', ':'), ensure_ascii=False
+    ).encode('utf-8')
 
 
 def calculate_checksum(data: Dict[str, Any]) -> str:
@@ -22,32 +87,42 @@ def calculate_checksum(data: Dict[str, Any]) -> str:
     Returns:
         Hex string of SHA-256 hash
     """
-    # Sort keys for consistent hashing
-    json_str = json.dumps(data, sort_keys=True, separators=(',', ':'))
-    return hashlib.sha256(json_str.encode('utf-8')).hexdigest()
+    return _sha256_oneshot(canonical_json(data)).hexdigest()
+
+
+def _agency_checksum_data(agency: Dict[str, Any],
+                          child_checksums: List[str]) -> Dict[str, Any]:
+    """
+    Build the checksummed projection of an agency record.
+    
+    Children contribute only their own checksums (Merkle-style), so a parent
+    never re-serializes its children's full records.
+    """
+    # Only named fields are read, so the record's own checksum never leaks in
+    data = {field: agency.get(field) for field in AGENCY_CHECKSUM_FIELDS}
+    data['cfr_references'] = agency.get('cfr_references', [])
+    data['children'] = child_checksums
+    return data
+
+
+def _correction_checksum_data(correction: Dict[str, Any]) -> Dict[str, Any]:
+    """Build the checksummed projection of a correction record."""
+    data = {field: correction.get(field) for field in CORRECTION_CHECKSUM_FIELDS}
+    data['cfr_references'] = correction.get('cfr_references', [])
+    return data
 
 
 def calculate_agency_checksum(agency: Dict[str, Any]) -> str:
     """
     Calculate checksum for an agency record.
     
-    Includes: name, short_name, slug, cfr_references, children
+    Includes: name, short_name, slug, cfr_references, children (by checksum)
     Excludes: display_name, sortable_name (derived fields), checksum (self-reference)
     """
-    # Create a copy without the checksum field to avoid circular dependency
-    agency_copy = {k: v for k, v in agency.items() if k != 'checksum'}
-    
-    checksum_data = {
-        'name': agency_copy.get('name'),
-        'short_name': agency_copy.get('short_name'),
-        'slug': agency_copy.get('slug'),
-        'cfr_references': agency_copy.get('cfr_references', []),
-        'children': [
-            {k: v for k, v in child.items() if k != 'checksum'}
-            for child in agency_copy.get('children', [])
-        ]
-    }
-    return calculate_checksum(checksum_data)
+    child_checksums = [
+        calculate_agency_checksum(child) for child in agency.get('children', [])
+    ]
+    return calculate_checksum(_agency_checksum_data(agency, child_checksums))
 
 
 def calculate_correction_checksum(correction: Dict[str, Any]) -> str:
@@ -57,20 +132,26 @@ def calculate_correction_checksum(correction: Dict[str, Any]) -> str:
     Includes: id, cfr_references, corrective_action, dates, fr_citation, title
     Excludes: checksum (self-reference)
     """
-    # Create a copy without the checksum field
-    correction_copy = {k: v for k, v in correction.items() if k != 'checksum'}
+    return calculate_checksum(_correction_checksum_data(correction))
+
+
+def _sha256_hex_batch(payloads: List[bytes]) -> List[str]:
+    """
+    Hash a batch of independent payloads, returning hex digests in order.
     
-    checksum_data = {
-        'id': correction_copy.get('id'),
-        'cfr_references': correction_copy.get('cfr_references', []),
-        'corrective_action': correction_copy.get('corrective_action'),
-        'error_corrected': correction_copy.get('error_corrected'),
-        'error_occurred': correction_copy.get('error_occurred'),
-        'fr_citation': correction_copy.get('fr_citation'),
-        'title': correction_copy.get('title'),
-        'year': correction_copy.get('year')
-    }
-    return calculate_checksum(checksum_data)
+    Records share no state, so this is the one place a multi-buffer SHA-256
+    backend would plug in. hexdigest() hex-encodes inside the hash object,
+    one C call per record with no intermediate bytes object to decode.
+    """
+    sha = _sha256_oneshot
+    return [sha(payload).hexdigest() for payload in payloads]
+
+
+def _assign_checksums(pairs: List[Tuple[Dict[str, Any], bytes]]) -> None:
+    """Hash pre-serialized payloads and store each digest on its record."""
+    digests = _sha256_hex_batch([payload for _, payload in pairs])
+    for (record, _), digest in zip(pairs, digests):
+        record['checksum'] = digest
 
 
 def add_checksums_to_agencies(agencies_data: Dict[str, Any]) -> Dict[str, Any]:
@@ -83,12 +164,20 @@ def add_checksums_to_agencies(agencies_data: Dict[str, Any]) -> Dict[str, Any]:
     Returns:
         Modified data with checksums added
     """
-    for agency in agencies_data.get('agencies', []):
-        agency['checksum'] = calculate_agency_checksum(agency)
-        
-        # Add checksums to children
-        for child in agency.get('children', []):
-            child['checksum'] = calculate_agency_checksum(child)
+    # Group the tree by depth so children are hashed before their parents
+    levels = []
+    level = agencies_data.get('agencies', [])
+    while level:
+        levels.append(level)
+        level = [child for agency in level for child in agency.get('children', [])]
+    
+    for level in reversed(levels):
+        _assign_checksums([
+            (agency, canonical_json(_agency_checksum_data(
+                agency, [child['checksum'] for child in agency.get('children', [])]
+            )))
+            for agency in level
+        ])
     
     return agencies_data
 
@@ -103,44 +192,69 @@ def add_checksums_to_corrections(corrections_data: Dict[str, Any]) -> Dict[str,
     Returns:
         Modified data with checksums added
     """
-    for correction in corrections_data.get('ecfr_corrections', []):
-        correction['checksum'] = calculate_correction_checksum(correction)
+    pairs = [
+        (correction, canonical_json(_correction_checksum_data(correction)))
+        for correction in corrections_data.get('ecfr_corrections', [])
+    ]
     
+    _assign_checksums(pairs)
     return corrections_data
 
 
+def _load_json(path: str) -> Dict[str, Any]:
+    """Read a JSON file."""
+    with open(path, 'r') as f:
+        return json.load(f)
+
+
+def _write_json(data: Dict[str, Any], path: str) -> None:
+    """Write data to a JSON file, indented for readability."""
+    if orjson is not None:
+        with open(path, 'wb') as f:
+            f.write(orjson.dumps(data, option=orjson.OPT_INDENT_2))
+        return
+    with open(path, 'w') as f:
+        json.dump(data, f, indent=2)
+
+
 if __name__ == '__main__':
     # Test checksum calculation
-    import sys
+    from concurrent.futures import ThreadPoolExecutor
     
+    print(f"SHA extensions available: {sha_extensions_available()}")
     print("Loading data files...")
     
-    with open('json/usds/ecfr/agencies.json', 'r') as f:
-        agencies = json.load(f)
-    
-    with open('json/usds/ecfr/corrections.json', 'r') as f:
-        corrections = json.load(f)
-    
-    print(f"Calculating checksums for {len(agencies['agencies'])} agencies...")
-    agencies = add_checksums_to_agencies(agencies)
-    
-    print(f"Calculating checksums for {len(corrections['ecfr_corrections'])} corrections...")
-    corrections = add_checksums_to_corrections(corrections)
-    
-    # Show sample checksums
-    print("\n--- Sample Checksums ---")
-    print(f"First agency: {agencies['agencies'][0]['name']}")
-    print(f"  Checksum: {agencies['agencies'][0]['checksum'][:16]}...")
-    
-    print(f"\nFirst correction (ID {corrections['ecfr_corrections'][0]['id']}):")
-    print(f"  Checksum: {corrections['ecfr_corrections'][0]['checksum'][:16]}...")
-    
-    # Write back with checksums
-    print("\nWriting files with checksums...")
-    with open('json/usds/ecfr/agencies_with_checksums.json', 'w') as f:
-        json.dump(agencies, f, indent=2)
-    
-    with open('json/usds/ecfr/corrections_with_checksums.json', 'w') as f:
-        json.dump(corrections, f, indent=2)
+    # File reads and writes run on a small I/O pool so they overlap with
+    # checksum computation for the other dataset.
+    with ThreadPoolExecutor(max_workers=2) as io_pool:
+        agencies_future = io_pool.submit(_load_json, 'json/usds/ecfr/agencies.json')
+        corrections_future = io_pool.submit(_load_json, 'json/usds/ecfr/corrections.json')
+        
+        agencies = agencies_future.result()
+        print(f"Calculating checksums for {len(agencies['agencies'])} agencies...")
+        agencies = add_checksums_to_agencies(agencies)
+        agencies_written = io_pool.submit(
+            _write_json, agencies, 'json/usds/ecfr/agencies_with_checksums.json'
+        )
+        
+        corrections = corrections_future.result()
+        print(f"Calculating checksums for {len(corrections['ecfr_corrections'])} corrections...")
+        corrections = add_checksums_to_corrections(corrections)
+        corrections_written = io_pool.submit(
+            _write_json, corrections, 'json/usds/ecfr/corrections_with_checksums.json'
+        )
+        
+        # Show sample checksums
+        print("\n--- Sample Checksums ---")
+        print(f"First agency: {agencies['agencies'][0]['name']}")
+        print(f"  Checksum: {agencies['agencies'][0]['checksum'][:16]}...")
+        
+        print(f"\nFirst correction (ID {corrections['ecfr_corrections'][0]['id']}):")
+        print(f"  Checksum: {corrections['ecfr_corrections'][0]['checksum'][:16]}...")
+        
+        # Wait for the files with checksums to land
+        print("\nWriting files with checksums...")
+        agencies_written.result()
+        corrections_written.result()
     
     print("✅ Checksums calculated and saved")
@@ -7,12 +7,12 @@
 
 -- Raw agencies data (JSON storage)
 CREATE TABLE IF NOT EXISTS agencies_raw (
-    id INTEGER PRIMARY KEY,
+    id INTEGER PRIMARY KEY,  -- Same id as the agencies_parsed row
     slug VARCHAR UNIQUE NOT NULL,
     name VARCHAR NOT NULL,
     short_name VARCHAR,
     parent_slug VARCHAR,  -- NULL for top-level agencies
-    data JSON NOT NULL,
+    data JSON,  -- NULL for sub-agencies (embedded in the parent's data)
     checksum VARCHAR(64) NOT NULL,
     ingested_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
 );
@@ -42,8 +42,9 @@ CREATE TABLE IF NOT EXISTS ingestion_log (
 -- ============================================================================
 
 -- Agencies with computed fields
+CREATE SEQUENCE IF NOT EXISTS agencies_id_seq START 1;
 CREATE TABLE IF NOT EXISTS agencies_parsed (
-    id INTEGER PRIMARY KEY,
+    id INTEGER PRIMARY KEY DEFAULT nextval('agencies_id_seq'),
     slug VARCHAR UNIQUE NOT NULL,
     name VARCHAR NOT NULL,
     short_name VARCHAR,
@@ -5,16 +5,53 @@ Loads agencies and corrections data from JSON files into DuckDB for analytics.
 Handles checksums, data validation, and transformation.
 """
 
-import json
 import hashlib
-from datetime import datetime
+import logging
+import shutil
+import sys
+from contextlib import contextmanager
 from pathlib import Path
-from typing import Dict, Any, List, Tuple
+from types import MappingProxyType
+from typing import Dict, Any, Iterator, List, Mapping, Optional, Tuple
 import duckdb
+import orjson
+import pyarrow as pa
 
 from checksums import add_checksums_to_agencies, add_checksums_to_corrections
 
 
+logger = logging.getLogger(__name__)
+
+SCHEMA_PATH = Path(__file__).parent / 'duckdb_schema.sql'
+FILE_CHUNK_SIZE = 1 << 20
+
+# Shared read-only default for missing nested objects (no per-row allocation)
+_EMPTY: Mapping[str, Any] = MappingProxyType({})
+
+# Columns supplied by the corrections loader; omitted ones take schema defaults
+CORRECTIONS_RAW_COLUMNS = ['id', 'ecfr_id', 'data', 'checksum']
+CORRECTIONS_PARSED_COLUMNS = [
+    'id', 'ecfr_id', 'cfr_reference', 'title', 'chapter', 'part', 'section',
+    'corrective_action', 'error_occurred', 'error_corrected',
+    'fr_citation', 'year', 'checksum'
+]
+
+
+def _iter_agencies(data: Dict[str, Any]) -> Iterator[Tuple[Optional[str], Dict[str, Any]]]:
+    """
+    Walk the agency tree once, parents before their children.
+    
+    Yields:
+        (parent_slug, agency) tuples; parent_slug is None for top-level agencies
+    """
+    for agency in data['agencies']:
+        yield None, agency
+        
+        parent_slug = agency['slug']
+        for child in agency.get('children', []):
+            yield parent_slug, child
+
+
 class ECFRIngestion:
     """Manages ingestion of eCFR data into DuckDB."""
     
@@ -31,33 +68,79 @@ class ECFRIngestion:
     def connect(self):
         """Establish DuckDB connection."""
         self.conn = duckdb.connect(self.db_path)
-        print(f"✅ Connected to DuckDB: {self.db_path}")
+        logger.info("✅ Connected to DuckDB: %s", self.db_path)
         
     def close(self):
         """Close DuckDB connection."""
         if self.conn:
             self.conn.close()
-            print("✅ Closed DuckDB connection")
+            logger.info("✅ Closed DuckDB connection")
     
     def initialize_schema(self):
         """Create tables and views from schema file."""
-        schema_path = Path(__file__).parent / 'duckdb_schema.sql'
-        
-        with open(schema_path, 'r') as f:
+        with open(SCHEMA_PATH, 'r') as f:
             schema_sql = f.read()
         
         # Execute schema (DuckDB supports multiple statements)
         self.conn.execute(schema_sql)
-        print("✅ Initialized DuckDB schema")
+        logger.info("✅ Initialized DuckDB schema")
     
     def calculate_file_checksum(self, file_path: Path) -> str:
         """Calculate SHA-256 checksum of entire file."""
-        sha256 = hashlib.sha256()
         with open(file_path, 'rb') as f:
-            for chunk in iter(lambda: f.read(8192), b''):
-                sha256.update(chunk)
+            # Python 3.11+: OpenSSL hashes straight from the file descriptor
+            if hasattr(hashlib, 'file_digest'):
+                return hashlib.file_digest(f, 'sha256').hexdigest()
+            
+            # Older interpreters: 1 MiB reads into one reused buffer
+            sha256 = hashlib.sha256()
+            buf = memoryview(bytearray(FILE_CHUNK_SIZE))
+            while n := f.readinto(buf):
+                sha256.update(buf[:n])
         return sha256.hexdigest()
     
+    @contextmanager
+    def _transaction(self):
+        """Run a block in a single DuckDB transaction, rolling back on error."""
+        self.conn.execute("BEGIN TRANSACTION")
+        try:
+            yield
+        except Exception:
+            self.conn.execute("ROLLBACK")
+            raise
+        self.conn.execute("COMMIT")
+    
+    @contextmanager
+    def _staged(self, view: str, columns: Dict[str, list]):
+        """
+        Expose column buffers to SQL as a temporary Arrow view.
+        
+        DuckDB scans the Arrow vectors directly, so inserting from the view
+        needs no per-row parameter binding.
+        """
+        self.conn.register(view, pa.table({name: pa.array(values) for name, values in columns.items()}))
+        try:
+            yield view
+        finally:
+            self.conn.unregister(view)
+    
+    def _insert_columns(self, table: str, columns: Dict[str, list]):
+        """
+        Bulk-insert column buffers into a table with a single INSERT ... SELECT.
+        
+        Omitted columns take their schema defaults.
+        """
+        if not len(next(iter(columns.values()))):
+            return
+        names = ', '.join(columns)
+        with self._staged(f'{table}_stage', columns) as view:
+            self.conn.execute(f"INSERT INTO {table} ({names}) SELECT {names} FROM {view}")
+    
+    def _append_rows(self, table: str, columns: List[str], rows: List[tuple]):
+        """Bulk-insert buffered row tuples, transposed into column buffers."""
+        if rows:
+            self._insert_columns(table, dict(zip(columns, zip(*rows))))
+    
     def load_agencies(self, json_path: Path) -> Tuple[int, int]:
         """
         Load agencies data into DuckDB.
@@ -68,121 +151,91 @@ class ECFRIngestion:
         Returns:
             Tuple of (parent_agencies_count, sub_agencies_count)
         """
-        print(f"\n📥 Loading agencies from {json_path}")
+        logger.info("\n📥 Loading agencies from %s", json_path)
         
-        with open(json_path, 'r') as f:
-            data = json.load(f)
+        with open(json_path, 'rb') as f:
+            data = orjson.loads(f.read())
         
         # Add checksums if not present
         if 'checksum' not in data['agencies'][0]:
-            print("  Calculating checksums...")
+            logger.info("  Calculating checksums...")
             data = add_checksums_to_agencies(data)
         
-        parent_count = 0
-        sub_count = 0
+        # Pass 1: walk the tree once into column buffers. agencies_raw and
+        # agencies_parsed share most columns, so both read the same lists.
+        slugs, names, short_names, parent_slugs = [], [], [], []
+        data_json, checksums, cfr_counts, child_counts = [], [], [], []
+        cfr_slugs, cfr_titles, cfr_chapters, cfr_subtitles, cfr_parts = [], [], [], [], []
         
-        # Insert parent agencies
-        for idx, agency in enumerate(data['agencies'], start=1):
-            self.conn.execute("""
-                INSERT INTO agencies_raw (id, slug, name, short_name, parent_slug, data, checksum)
-                VALUES (?, ?, ?, ?, ?, ?, ?)
-            """, [
-                idx,
-                agency['slug'],
-                agency['name'],
-                agency.get('short_name'),
-                None,  # Parent agencies have no parent
-                json.dumps(agency),
-                agency['checksum']
-            ])
-            
-            # Parse into structured table
-            self.conn.execute("""
-                INSERT INTO agencies_parsed (id, slug, name, short_name, parent_slug, 
-                                            cfr_reference_count, child_count, checksum)
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-            """, [
-                idx,
-                agency['slug'],
-                agency['name'],
-                agency.get('short_name'),
-                None,
-                len(agency.get('cfr_references', [])),
-                len(agency.get('children', [])),
-                agency['checksum']
-            ])
-            
-            # Insert CFR references
-            for cfr_ref in agency.get('cfr_references', []):
-                self.conn.execute("""
-                    INSERT INTO cfr_references (agency_slug, title, chapter, subtitle, part)
-                    VALUES (?, ?, ?, ?, ?)
-                """, [
-                    agency['slug'],
-                    cfr_ref.get('title'),
-                    cfr_ref.get('chapter'),
-                    cfr_ref.get('subtitle'),
-                    cfr_ref.get('part')
-                ])
+        for parent_slug, agency in _iter_agencies(data):
+            slug = agency['slug']
+            cfr_refs = agency.get('cfr_references', [])
             
-            parent_count += 1
+            slugs.append(slug)
+            names.append(agency['name'])
+            short_names.append(agency.get('short_name'))
+            parent_slugs.append(parent_slug)
+            # Children are already embedded in their parent's JSON; storing
+            # them again would duplicate every sub-agency document
+            data_json.append(orjson.dumps(agency).decode('utf-8') if parent_slug is None else None)
+            checksums.append(agency['checksum'])
+            cfr_counts.append(len(cfr_refs))
+            # Only top-level agencies have their children ingested
+            child_counts.append(len(agency.get('children', [])) if parent_slug is None else 0)
             
-            # Insert sub-agencies (children)
-            for child_idx, child in enumerate(agency.get('children', []), start=1):
-                child_id = idx * 1000 + child_idx  # Unique ID for children
-                
-                self.conn.execute("""
-                    INSERT INTO agencies_raw (id, slug, name, short_name, parent_slug, data, checksum)
-                    VALUES (?, ?, ?, ?, ?, ?, ?)
-                """, [
-                    child_id,
-                    child['slug'],
-                    child['name'],
-                    child.get('short_name'),
-                    agency['slug'],  # Parent slug
-                    json.dumps(child),
-                    child['checksum']
-                ])
-                
-                self.conn.execute("""
-                    INSERT INTO agencies_parsed (id, slug, name, short_name, parent_slug, 
-                                                cfr_reference_count, child_count, checksum)
-                    VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-                """, [
-                    child_id,
-                    child['slug'],
-                    child['name'],
-                    child.get('short_name'),
-                    agency['slug'],
-                    len(child.get('cfr_references', [])),
-                    0,  # Children don't have children
-                    child['checksum']
-                ])
-                
-                # Insert CFR references for child
-                for cfr_ref in child.get('cfr_references', []):
-                    self.conn.execute("""
-                        INSERT INTO cfr_references (agency_slug, title, chapter, subtitle, part)
-                        VALUES (?, ?, ?, ?, ?)
-                    """, [
-                        child['slug'],
-                        cfr_ref.get('title'),
-                        cfr_ref.get('chapter'),
-                        cfr_ref.get('subtitle'),
-                        cfr_ref.get('part')
-                    ])
-                
-                sub_count += 1
-        
-        # Log ingestion
+            for cfr_ref in cfr_refs:
+                cfr_slugs.append(slug)
+                cfr_titles.append(cfr_ref.get('title'))
+                cfr_chapters.append(cfr_ref.get('chapter'))
+                cfr_subtitles.append(cfr_ref.get('subtitle'))
+                cfr_parts.append(cfr_ref.get('part'))
+        
+        parent_count = parent_slugs.count(None)
+        sub_count = len(slugs) - parent_count
+        
         file_checksum = self.calculate_file_checksum(json_path)
-        self.conn.execute("""
-            INSERT INTO ingestion_log (source_file, record_count, file_checksum)
-            VALUES (?, ?, ?)
-        """, [str(json_path), parent_count + sub_count, file_checksum])
         
-        print(f"  ✅ Loaded {parent_count} parent agencies")
-        print(f"  ✅ Loaded {sub_count} sub-agencies")
+        # Pass 2: hand the buffers to DuckDB in bulk, in one transaction per
+        # file so a failed load leaves no partial rows
+        with self._transaction():
+            # agencies_parsed draws ids from agencies_id_seq; agencies_raw then
+            # reuses the id assigned to each slug
+            self._insert_columns('agencies_parsed', {
+                'slug': slugs,
+                'name': names,
+                'short_name': short_names,
+                'parent_slug': parent_slugs,
+                'cfr_reference_count': cfr_counts,
+                'child_count': child_counts,
+                'checksum': checksums,
+            })
+            with self._staged('agencies_raw_stage', {
+                'slug': slugs,
+                'data': data_json,
+            }) as view:
+                self.conn.execute(f"""
+                    INSERT INTO agencies_raw (id, slug, name, short_name, parent_slug, data, checksum)
+                    SELECT p.id, p.slug, p.name, p.short_name, p.parent_slug, s.data, p.checksum
+                    FROM {view} s
+                    JOIN agencies_parsed p ON p.slug = s.slug
+                    ORDER BY p.id
+                """)
+            self._insert_columns('cfr_references', {
+                'agency_slug': cfr_slugs,
+                'title': cfr_titles,
+                'chapter': cfr_chapters,
+                'subtitle': cfr_subtitles,
+                'part': cfr_parts,
+            })
+            
+            # Log ingestion
+            self.conn.execute("""
+                INSERT INTO ingestion_log (source_file, record_count, file_checksum)
+                VALUES (?, ?, ?)
+            """, [str(json_path), parent_count + sub_count, file_checksum])
+        
+        logger.info("  ✅ Loaded %s parent agencies", parent_count)
+        logger.info("  ✅ Loaded %s sub-agencies", sub_count)
         
         return parent_count, sub_count
     
@@ -196,120 +249,120 @@ class ECFRIngestion:
         Returns:
             Number of corrections loaded
         """
-        print(f"\n📥 Loading corrections from {json_path}")
+        logger.info("\n📥 Loading corrections from %s", json_path)
         
-        with open(json_path, 'r') as f:
-            data = json.load(f)
+        with open(json_path, 'rb') as f:
+            data = orjson.loads(f.read())
         
         # Add checksums if not present
         if 'checksum' not in data['ecfr_corrections'][0]:
-            print("  Calculating checksums...")
+            logger.info("  Calculating checksums...")
             data = add_checksums_to_corrections(data)
         
-        count = 0
+        raw_rows = []
+        parsed_rows = []
         
         for idx, correction in enumerate(data['ecfr_corrections'], start=1):
+            # Bind fields used more than once to locals
+            ecfr_id = correction['id']
+            checksum = correction['checksum']
+            get = correction.get
+            
             # Insert raw data
-            self.conn.execute("""
-                INSERT INTO corrections_raw (id, ecfr_id, data, checksum)
-                VALUES (?, ?, ?, ?)
-            """, [
+            raw_rows.append((
                 idx,
-                correction['id'],
-                json.dumps(correction),
-                correction['checksum']
-            ])
+                ecfr_id,
+                orjson.dumps(correction).decode('utf-8'),
+                checksum
+            ))
             
             # Parse CFR reference
-            cfr_ref = correction.get('cfr_references', [{}])[0].get('cfr_reference', '')
-            hierarchy = correction.get('cfr_references', [{}])[0].get('hierarchy', {})
-            
-            # Calculate lag days
-            lag_days = None
-            if correction.get('error_occurred') and correction.get('error_corrected'):
-                try:
-                    occurred = datetime.strptime(correction['error_occurred'], '%Y-%m-%d')
-                    corrected = datetime.strptime(correction['error_corrected'], '%Y-%m-%d')
-                    lag_days = (corrected - occurred).days
-                except:
-                    pass
+            refs = get('cfr_references')
+            first_ref = refs[0] if refs else _EMPTY
+            cfr_ref = first_ref.get('cfr_reference', '')
+            hierarchy = first_ref.get('hierarchy', _EMPTY)
             
             # Insert parsed data
-            self.conn.execute("""
-                INSERT INTO corrections_parsed (
-                    id, ecfr_id, cfr_reference, title, chapter, part, section,
-                    corrective_action, error_occurred, error_corrected, lag_days,
-                    fr_citation, year, checksum
-                )
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-            """, [
+            parsed_rows.append((
                 idx,
-                correction['id'],
+                ecfr_id,
                 cfr_ref,
                 correction['title'],
                 hierarchy.get('chapter'),
                 hierarchy.get('part'),
                 hierarchy.get('section'),
-                correction.get('corrective_action'),
-                correction.get('error_occurred'),
-                correction.get('error_corrected'),
-                lag_days,
-                correction.get('fr_citation'),
+                get('corrective_action'),
+                get('error_occurred'),
+                get('error_corrected'),
+                get('fr_citation'),
                 correction['year'],
-                correction['checksum']
-            ])
-            
-            count += 1
+                checksum
+            ))
+        
+        count = len(raw_rows)
         
-        # Log ingestion
         file_checksum = self.calculate_file_checksum(json_path)
-        self.conn.execute("""
-            INSERT INTO ingestion_log (source_file, record_count, file_checksum)
-            VALUES (?, ?, ?)
-        """, [str(json_path), count, file_checksum])
         
-        print(f"  ✅ Loaded {count} corrections")
+        # One transaction per file, so a failed load leaves no partial rows
+        with self._transaction():
+            self._append_rows('corrections_raw', CORRECTIONS_RAW_COLUMNS, raw_rows)
+            self._append_rows('corrections_parsed', CORRECTIONS_PARSED_COLUMNS, parsed_rows)
+            
+            # Calculate lag days in one vectorized pass over the loaded dates
+            self.conn.execute("""
+                UPDATE corrections_parsed
+                SET lag_days = date_diff('day', error_occurred, error_corrected)
+                WHERE error_occurred IS NOT NULL AND error_corrected IS NOT NULL
+            """)
+            
+            # Log ingestion
+            self.conn.execute("""
+                INSERT INTO ingestion_log (source_file, record_count, file_checksum)
+                VALUES (?, ?, ?)
+            """, [str(json_path), count, file_checksum])
+        
+        logger.info("  ✅ Loaded %s corrections", count)
         
         return count
     
     def verify_data(self):
         """Run verification queries to ensure data integrity."""
-        print("\n🔍 Verifying data integrity...")
-        
-        # Check record counts
-        agencies_count = self.conn.execute("SELECT COUNT(*) FROM agencies_parsed").fetchone()[0]
-        corrections_count = self.conn.execute("SELECT COUNT(*) FROM corrections_parsed").fetchone()[0]
-        cfr_refs_count = self.conn.execute("SELECT COUNT(*) FROM cfr_references").fetchone()[0]
-        
-        print(f"  Agencies: {agencies_count}")
-        print(f"  Corrections: {corrections_count}")
-        print(f"  CFR References: {cfr_refs_count}")
+        logger.info("\n🔍 Verifying data integrity...")
+        
+        # Counts, duplicate slugs and NULL checksums in a single round trip
+        (
+            agencies_count, corrections_count, cfr_refs_count,
+            dup_agencies, null_checksums,
+        ) = self.conn.execute("""
+            SELECT 
+                COUNT(*),
+                (SELECT COUNT(*) FROM corrections_parsed),
+                (SELECT COUNT(*) FROM cfr_references),
+                (SELECT COUNT(*) FROM (
+                    SELECT slug FROM agencies_parsed GROUP BY slug HAVING COUNT(*) > 1
+                )),
+                COUNT(*) FILTER (WHERE checksum IS NULL)
+            FROM agencies_parsed
+        """).fetchone()
+        
+        logger.info("  Agencies: %s", agencies_count)
+        logger.info("  Corrections: %s", corrections_count)
+        logger.info("  CFR References: %s", cfr_refs_count)
         
         # Check for duplicates
-        dup_agencies = self.conn.execute("""
-            SELECT slug, COUNT(*) as cnt 
-            FROM agencies_parsed 
-            GROUP BY slug 
-            HAVING COUNT(*) > 1
-        """).fetchall()
-        
         if dup_agencies:
-            print(f"  ⚠️  Found {len(dup_agencies)} duplicate agency slugs")
+            logger.warning("  ⚠️  Found %s duplicate agency slugs", dup_agencies)
         else:
-            print("  ✅ No duplicate agencies")
+            logger.info("  ✅ No duplicate agencies")
         
         # Check checksums
-        null_checksums = self.conn.execute("""
-            SELECT COUNT(*) FROM agencies_parsed WHERE checksum IS NULL
-        """).fetchone()[0]
-        
         if null_checksums > 0:
-            print(f"  ⚠️  Found {null_checksums} agencies with NULL checksums")
+            logger.warning("  ⚠️  Found %s agencies with NULL checksums", null_checksums)
         else:
-            print("  ✅ All agencies have checksums")
+            logger.info("  ✅ All agencies have checksums")
         
         # Sample analytics
-        print("\n📊 Sample Analytics:")
+        logger.info("\n📊 Sample Analytics:")
         
         top_agencies = self.conn.execute("""
             SELECT name, total_corrections, rvi
@@ -319,9 +372,9 @@ class ECFRIngestion:
             LIMIT 5
         """).fetchall()
         
-        print("  Top 5 agencies by correction count:")
+        logger.info("  Top 5 agencies by correction count:")
         for name, corrections, rvi in top_agencies:
-            print(f"    {name}: {corrections} corrections (RVI: {rvi})")
+            logger.info("    %s: %s corrections (RVI: %s)", name, corrections, rvi)
         
         yearly_trends = self.conn.execute("""
             SELECT year, correction_count, ROUND(avg_lag_days, 1) as avg_lag
@@ -330,16 +383,18 @@ class ECFRIngestion:
             LIMIT 5
         """).fetchall()
         
-        print("\n  Recent correction trends:")
+        logger.info("\n  Recent correction trends:")
         for year, count, avg_lag in yearly_trends:
-            print(f"    {year}: {count} corrections (avg lag: {avg_lag} days)")
+            logger.info("    %s: %s corrections (avg lag: %s days)", year, count, avg_lag)
 
 
 def main():
     """Run the complete ingestion pipeline."""
-    print("=" * 60)
-    print("eCFR Data Ingestion Pipeline")
-    print("=" * 60)
+    logging.basicConfig(level=logging.INFO, format='%(message)s', stream=sys.stdout)
+    
+    logger.info("=" * 60)
+    logger.info("eCFR Data Ingestion Pipeline")
+    logger.info("=" * 60)
     
     # Paths
     base_path = Path(__file__).parent
@@ -347,17 +402,30 @@ def main():
     corrections_json = base_path / 'json/usds/ecfr/corrections.json'
     db_path = base_path / 'ecfr_analytics.duckdb'
     
+    template_path = base_path / 'ecfr_analytics.template.duckdb'
+    
+    # Build the empty-schema template once; rebuild when the schema changes
+    if (not template_path.exists()
+            or template_path.stat().st_mtime < SCHEMA_PATH.stat().st_mtime):
+        template = ECFRIngestion(str(base_path / 'ecfr_analytics.template.tmp.duckdb'))
+        template.connect()
+        template.initialize_schema()
+        template.close()
+        Path(template.db_path).replace(template_path)
+    
     # Remove existing database for clean start
     if db_path.exists():
         db_path.unlink()
-        print(f"🗑️  Removed existing database: {db_path}")
+        logger.info("🗑️  Removed existing database: %s", db_path)
+    
+    # Start from a copy of the template instead of re-running the schema DDL
+    shutil.copyfile(template_path, db_path)
     
     # Initialize pipeline
     pipeline = ECFRIngestion(str(db_path))
     
     try:
         pipeline.connect()
-        pipeline.initialize_schema()
         
         # Load data
         pipeline.load_agencies(agencies_json)
@@ -366,10 +434,10 @@ def main():
         # Verify
         pipeline.verify_data()
         
-        print("\n" + "=" * 60)
-        print("✅ Ingestion complete!")
-        print(f"📁 Database: {db_path}")
-        print("=" * 60)
+        logger.info("\n" + "=" * 60)
+        logger.info("✅ Ingestion complete!")
+        logger.info("📁 Database: %s", db_path)
+        logger.info("=" * 60)
         
     finally:
         pipeline.close()
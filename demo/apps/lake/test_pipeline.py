@@ -8,32 +8,64 @@ Validates:
 - Export data quality
 """
 
-import json
+import atexit
+from functools import lru_cache
 from pathlib import Path
 import duckdb
+import orjson
+
+
+@lru_cache(maxsize=None)
+def _load(path):
+    """Parse a JSON file once per test session."""
+    with open(path, 'rb') as f:
+        return orjson.loads(f.read())
+
+
+@lru_cache(maxsize=1)
+def _conn():
+    """Open the analytics database once and share it across tests."""
+    conn = duckdb.connect(str(Path(__file__).parent / 'ecfr_analytics.duckdb'), read_only=True)
+    atexit.register(conn.close)
+    return conn
 
 
 def test_data_integrity():
     """Test that all data was ingested correctly."""
     print("\n🧪 Testing Data Integrity...")
     
-    db_path = Path(__file__).parent / 'ecfr_analytics.duckdb'
-    conn = duckdb.connect(str(db_path), read_only=True)
+    conn = _conn()
     
     # Test 1: Record counts match source files
-    with open('json/usds/ecfr/agencies.json', 'r') as f:
-        agencies_json = json.load(f)
-    
-    with open('json/usds/ecfr/corrections.json', 'r') as f:
-        corrections_json = json.load(f)
+    agencies_json = _load('json/usds/ecfr/agencies.json')
+    corrections_json = _load('json/usds/ecfr/corrections.json')
     
     expected_agencies = len(agencies_json['agencies'])
     expected_sub_agencies = sum(len(a.get('children', [])) for a in agencies_json['agencies'])
     expected_total = expected_agencies + expected_sub_agencies
     expected_corrections = len(corrections_json['ecfr_corrections'])
     
-    actual_agencies = conn.execute("SELECT COUNT(*) FROM agencies_parsed").fetchone()[0]
-    actual_corrections = conn.execute("SELECT COUNT(*) FROM corrections_parsed").fetchone()[0]
+    # One round trip: each table is scanned once for all of its integrity counts
+    (
+        actual_agencies, null_agency_checksums, dup_agencies,
+        actual_corrections, null_correction_checksums, dup_corrections,
+    ) = conn.execute("""
+        WITH a AS (
+            SELECT 
+                COUNT(*),
+                COUNT(*) FILTER (WHERE checksum IS NULL),
+                COUNT(*) - COUNT(DISTINCT slug)
+            FROM agencies_parsed
+        ),
+        c AS (
+            SELECT 
+                COUNT(*),
+                COUNT(*) FILTER (WHERE checksum IS NULL),
+                COUNT(*) - COUNT(DISTINCT ecfr_id)
+            FROM corrections_parsed
+        )
+        SELECT * FROM a, c
+    """).fetchone()
     
     assert actual_agencies == expected_total, f"Agency count mismatch: {actual_agencies} != {expected_total}"
     assert actual_corrections == expected_corrections, f"Correction count mismatch: {actual_corrections} != {expected_corrections}"
@@ -42,92 +74,77 @@ def test_data_integrity():
     print(f"  ✅ Correction count: {actual_corrections} (expected {expected_corrections})")
     
     # Test 2: No NULL checksums
-    null_checksums = conn.execute("""
-        SELECT COUNT(*) FROM agencies_parsed WHERE checksum IS NULL
-    """).fetchone()[0]
-    
-    assert null_checksums == 0, f"Found {null_checksums} agencies with NULL checksums"
+    assert null_agency_checksums == 0, f"Found {null_agency_checksums} agencies with NULL checksums"
     print(f"  ✅ All agencies have checksums")
     
-    null_checksums = conn.execute("""
-        SELECT COUNT(*) FROM corrections_parsed WHERE checksum IS NULL
-    """).fetchone()[0]
-    
-    assert null_checksums == 0, f"Found {null_checksums} corrections with NULL checksums"
+    assert null_correction_checksums == 0, f"Found {null_correction_checksums} corrections with NULL checksums"
     print(f"  ✅ All corrections have checksums")
     
     # Test 3: No duplicate records
-    dup_agencies = conn.execute("""
-        SELECT COUNT(*) FROM (
-            SELECT slug, COUNT(*) as cnt 
-            FROM agencies_parsed 
-            GROUP BY slug 
-            HAVING COUNT(*) > 1
-        )
-    """).fetchone()[0]
-    
     assert dup_agencies == 0, f"Found {dup_agencies} duplicate agency slugs"
     print(f"  ✅ No duplicate agencies")
     
-    dup_corrections = conn.execute("""
-        SELECT COUNT(*) FROM (
-            SELECT ecfr_id, COUNT(*) as cnt 
-            FROM corrections_parsed 
-            GROUP BY ecfr_id 
-            HAVING COUNT(*) > 1
-        )
-    """).fetchone()[0]
-    
     assert dup_corrections == 0, f"Found {dup_corrections} duplicate corrections"
     print(f"  ✅ No duplicate corrections")
-    
-    conn.close()
 
 
 def test_checksum_verification():
     """Test that checksums are valid and consistent."""
     print("\n🧪 Testing Checksum Verification...")
     
+    from duckdb.typing import VARCHAR
     from checksums import calculate_agency_checksum, calculate_correction_checksum
     
-    db_path = Path(__file__).parent / 'ecfr_analytics.duckdb'
-    conn = duckdb.connect(str(db_path), read_only=True)
-    
-    # Test a sample of agencies
-    agencies = conn.execute("""
-        SELECT data, checksum FROM agencies_raw LIMIT 10
-    """).fetchall()
-    
-    for data_json, stored_checksum in agencies:
-        data = json.loads(data_json)
-        calculated_checksum = calculate_agency_checksum(data)
-        assert calculated_checksum == stored_checksum, \
-            f"Checksum mismatch for agency {data.get('slug')}"
-    
-    print(f"  ✅ Verified {len(agencies)} agency checksums")
-    
-    # Test a sample of corrections
-    corrections = conn.execute("""
-        SELECT data, checksum FROM corrections_raw LIMIT 10
-    """).fetchall()
-    
-    for data_json, stored_checksum in corrections:
-        data = json.loads(data_json)
-        calculated_checksum = calculate_correction_checksum(data)
-        assert calculated_checksum == stored_checksum, \
-            f"Checksum mismatch for correction {data.get('id')}"
-    
-    print(f"  ✅ Verified {len(corrections)} correction checksums")
-    
-    conn.close()
+    conn = _conn()
+    
+    # Recompute checksums inside the scan so every row is verified in one query
+    conn.create_function(
+        'agency_cksum', lambda data: calculate_agency_checksum(orjson.loads(data)),
+        [VARCHAR], VARCHAR
+    )
+    conn.create_function(
+        'correction_cksum', lambda data: calculate_correction_checksum(orjson.loads(data)),
+        [VARCHAR], VARCHAR
+    )
+    
+    try:
+        # Test all agencies; sub-agency JSON lives inside the parent's data
+        agency_count, bad_agencies = conn.execute("""
+            WITH documents AS (
+                SELECT slug, data FROM agencies_raw WHERE parent_slug IS NULL
+                UNION ALL
+                SELECT child->>'slug', child
+                FROM agencies_raw, UNNEST(json_extract(data, '$.children[*]')) AS t(child)
+                WHERE parent_slug IS NULL
+            )
+            SELECT COUNT(*), LIST(a.slug) FILTER (
+                WHERE d.data IS NULL OR agency_cksum(d.data) != a.checksum
+            )
+            FROM agencies_raw a
+            LEFT JOIN documents d ON d.slug = a.slug
+        """).fetchone()
+        
+        assert not bad_agencies, f"Checksum mismatch for agencies {bad_agencies[:10]}"
+        print(f"  ✅ Verified {agency_count} agency checksums")
+        
+        # Test all corrections
+        correction_count, bad_corrections = conn.execute("""
+            SELECT COUNT(*), LIST(ecfr_id) FILTER (WHERE correction_cksum(data) != checksum)
+            FROM corrections_raw
+        """).fetchone()
+        
+        assert not bad_corrections, f"Checksum mismatch for corrections {bad_corrections[:10]}"
+        print(f"  ✅ Verified {correction_count} correction checksums")
+    finally:
+        conn.remove_function('agency_cksum')
+        conn.remove_function('correction_cksum')
 
 
 def test_analytics_calculations():
     """Test that analytics are calculated correctly."""
     print("\n🧪 Testing Analytics Calculations...")
     
-    db_path = Path(__file__).parent / 'ecfr_analytics.duckdb'
-    conn = duckdb.connect(str(db_path), read_only=True)
+    conn = _conn()
     
     # Test 1: RVI calculation
     # RVI = (total_corrections / cfr_reference_count) * 100
@@ -150,7 +167,7 @@ def test_analytics_calculations():
     print(f"  ✅ RVI calculations verified for {len(sample)} agencies")
     
     # Test 2: Lag days calculation
-    sample_lags = conn.execute("""
+    lags = conn.execute("""
         SELECT 
             ecfr_id,
             error_occurred,
@@ -160,28 +177,15 @@ def test_analytics_calculations():
         WHERE error_occurred IS NOT NULL 
           AND error_corrected IS NOT NULL
           AND lag_days IS NOT NULL
-        LIMIT 5
-    """).fetchall()
+    """).fetchdf()
     
-    from datetime import datetime, date
+    # DATE columns arrive as datetime64, so the check is one vectorized subtract
+    expected_lag = (lags['error_corrected'] - lags['error_occurred']).dt.days
+    mismatched = lags.loc[expected_lag != lags['lag_days'], 'ecfr_id']
+    assert mismatched.empty, \
+        f"Lag days mismatch for corrections {mismatched.tolist()[:10]}"
     
-    for ecfr_id, occurred, corrected, lag_days in sample_lags:
-        # Handle both string and date objects
-        if isinstance(occurred, str):
-            occurred_dt = datetime.strptime(occurred, '%Y-%m-%d')
-        else:
-            occurred_dt = datetime.combine(occurred, datetime.min.time())
-        
-        if isinstance(corrected, str):
-            corrected_dt = datetime.strptime(corrected, '%Y-%m-%d')
-        else:
-            corrected_dt = datetime.combine(corrected, datetime.min.time())
-        
-        expected_lag = (corrected_dt - occurred_dt).days
-        assert lag_days == expected_lag, \
-            f"Lag days mismatch for correction {ecfr_id}: {lag_days} != {expected_lag}"
-    
-    print(f"  ✅ Lag day calculations verified for {len(sample_lags)} corrections")
+    print(f"  ✅ Lag day calculations verified for {len(lags)} corrections")
     
     # Test 3: Yearly trends aggregation
     yearly_count = conn.execute("""
@@ -200,8 +204,6 @@ def test_analytics_calculations():
             f"Yearly trend mismatch for 2024: {count} != {actual_count}"
         
         print(f"  ✅ Yearly trend aggregation verified (2024: {count} corrections)")
-    
-    conn.close()
 
 
 def test_export_data():
@@ -228,18 +230,15 @@ def test_export_data():
     # Test 2: Export files are valid JSON
     for filename in required_files:
         filepath = export_dir / filename
-        with open(filepath, 'r') as f:
-            data = json.load(f)
-            assert data is not None, f"Invalid JSON in {filename}"
+        data = _load(filepath)
+        assert data is not None, f"Invalid JSON in {filename}"
     
     print(f"  ✅ All export files contain valid JSON")
     
     # Test 3: Export record counts match database
-    db_path = Path(__file__).parent / 'ecfr_analytics.duckdb'
-    conn = duckdb.connect(str(db_path), read_only=True)
+    conn = _conn()
     
-    with open(export_dir / 'agencies.json', 'r') as f:
-        agencies_export = json.load(f)
+    agencies_export = _load(export_dir / 'agencies.json')
     
     db_agencies = conn.execute("SELECT COUNT(*) FROM export_agencies").fetchone()[0]
     assert len(agencies_export) == db_agencies, \
@@ -247,31 +246,26 @@ def test_export_data():
     
     print(f"  ✅ Agency export count matches database: {len(agencies_export)}")
     
-    with open(export_dir / 'corrections.json', 'r') as f:
-        corrections_export = json.load(f)
+    corrections_export = _load(export_dir / 'corrections.json')
     
     db_corrections = conn.execute("SELECT COUNT(*) FROM export_corrections").fetchone()[0]
     assert len(corrections_export) == db_corrections, \
         f"Correction export count mismatch: {len(corrections_export)} != {db_corrections}"
     
     print(f"  ✅ Correction export count matches database: {len(corrections_export)}")
-    
-    conn.close()
 
 
 def test_data_relationships():
     """Test that data relationships are correct."""
     print("\n🧪 Testing Data Relationships...")
     
-    db_path = Path(__file__).parent / 'ecfr_analytics.duckdb'
-    conn = duckdb.connect(str(db_path), read_only=True)
+    conn = _conn()
     
     # Test 1: All CFR references link to valid agencies
     orphan_refs = conn.execute("""
         SELECT COUNT(*) 
         FROM cfr_references cfr
-        LEFT JOIN agencies_parsed a ON cfr.agency_slug = a.slug
-        WHERE a.slug IS NULL
+        ANTI JOIN agencies_parsed a ON cfr.agency_slug = a.slug
     """).fetchone()[0]
     
     assert orphan_refs == 0, f"Found {orphan_refs} CFR references with invalid agency links"
@@ -281,11 +275,8 @@ def test_data_relationships():
     invalid_parents = conn.execute("""
         SELECT COUNT(*)
         FROM agencies_parsed child
+        ANTI JOIN agencies_parsed parent ON parent.slug = child.parent_slug
         WHERE child.parent_slug IS NOT NULL
-          AND NOT EXISTS (
-              SELECT 1 FROM agencies_parsed parent 
-              WHERE parent.slug = child.parent_slug
-          )
     """).fetchone()[0]
     
     assert invalid_parents == 0, f"Found {invalid_parents} agencies with invalid parent links"
@@ -306,8 +297,6 @@ def test_data_relationships():
     
     assert len(parent_check) == 0, f"Found {len(parent_check)} agencies with incorrect child counts"
     print(f"  ✅ All child counts are accurate")
-    
-    conn.close()
 
 
 def run_all_tests():